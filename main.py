@@ -1,45 +1,96 @@
 from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import uvicorn
 from enum import Enum
-from rss_core import fetch_tribune_news, fetch_news_by_category
-from langchain_groq import ChatGroq
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import StrOutputParser
+from rss_core import afetch_tribune_news, afetch_news_by_category, aclose_client
 from dotenv import load_dotenv
 import os
 import asyncio
-from time import time
+import httpx
+import time
+from collections import deque
+from cachetools import TTLCache
 
 # Load environment variables
 load_dotenv()
 groq_api = os.getenv("GROQ_API_KEY")
-
-# Initialize LLM
-model = ChatGroq(model="openai/gpt-oss-20b", temperature=0, api_key=groq_api)
+if not groq_api:
+    raise RuntimeError("GROQ_API_KEY is not set; add it to the environment or .env file")
+
+# LLM (Groq OpenAI-compatible endpoint, called directly)
+GROQ_URL = "https://api.groq.com/openai/v1/chat/completions"
+GROQ_MODEL = "openai/gpt-oss-20b"
+GROQ_MAX_RETRIES = 2  # extra attempts on 429/5xx, like the Groq SDK's default
+groq_client = httpx.AsyncClient(timeout=30, headers={"Authorization": f"Bearer {groq_api}"})
+# Caps concurrent Groq calls; the RPM window below caps how many start per minute
+llm_semaphore = asyncio.Semaphore(8)
+GROQ_RPM = 30
+groq_call_times = deque()  # monotonic start times of calls in the last 60s
+groq_rate_lock = asyncio.Lock()
+
+async def wait_for_groq_slot():
+    """Wait until another Groq call fits in the GROQ_RPM sliding window (callers are served in order)."""
+    async with groq_rate_lock:
+        now = time.monotonic()
+        while groq_call_times and now - groq_call_times[0] >= 60:
+            groq_call_times.popleft()
+        if len(groq_call_times) >= GROQ_RPM:
+            await asyncio.sleep(60 - (now - groq_call_times[0]))
+            groq_call_times.popleft()
+        groq_call_times.append(time.monotonic())
 
 # Summarization prompt - Three lines
-summary_prompt = ChatPromptTemplate.from_template(
-    "Summarize the following news content in three concise lines, capturing the main points clearly. Each line should be a key aspect or development. Avoid HTML tags or boilerplate text. Return only the summary text, with lines separated by newlines.\n\n{content}"
-)
-summarizer = summary_prompt | model | StrOutputParser()
+SUMMARY_PROMPT = "Summarize the following news content in three concise lines, capturing the main points clearly. Each line should be a key aspect or development. Avoid HTML tags or boilerplate text. Return only the summary text, with lines separated by newlines.\n\n{content}"
 
-# In-memory caches
-# raw_cache: key -> (raw_items, timestamp)
-# details_cache: key -> (details_list, timestamp)
+def retry_delay(response: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying: Retry-After when Groq sends it, else exponential backoff."""
+    try:
+        return float(response.headers["retry-after"])
+    except (KeyError, ValueError):
+        return 2 ** attempt
+
+async def summarize(content: str) -> str:
+    """Summarize news content with a Groq chat completion request, retrying on 429/5xx."""
+    payload = {
+        "model": GROQ_MODEL,
+        "messages": [{"role": "user", "content": SUMMARY_PROMPT.format(content=content)}],
+        "temperature": 0
+    }
+    for attempt in range(GROQ_MAX_RETRIES + 1):
+        await wait_for_groq_slot()
+        async with llm_semaphore:
+            response = await groq_client.post(GROQ_URL, json=payload)
+        if attempt < GROQ_MAX_RETRIES and (response.status_code == 429 or response.status_code >= 500):
+            await asyncio.sleep(retry_delay(response, attempt))
+            continue
+        break
+    response.raise_for_status()
+    # message.content can be null, e.g. when the model produced no text
+    return response.json()["choices"][0]["message"]["content"] or ""
+
+# In-memory caches (bounded, entries expire after CACHE_TTL)
+# raw_cache: key -> raw_items
+# details_cache: key -> details_list
+# partial_details_cache: key -> details_list with None for summaries still in flight
 CACHE_TTL = 1800  # 30 minutes in seconds
-raw_cache = {}
-details_cache = {}
+CACHE_MAXSIZE = 512
+raw_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+details_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+partial_details_cache = TTLCache(maxsize=CACHE_MAXSIZE, ttl=CACHE_TTL)
+# key -> running generate_top_10_details task; at most one generation per key
+generation_tasks = {}
 
 def get_cache_key(region: str, query: str, days_back: int) -> str:
     return f"{region}_{query}_{days_back}"
 
-def is_cache_valid(timestamp: float) -> bool:
-    return time() - timestamp < CACHE_TTL
-
 # FastAPI app
-app = FastAPI(title="Tribune News API", description="Structured APIs for region-specific news from Express Tribune with LLM summaries")
+app = FastAPI(
+    title="Tribune News API",
+    description="Structured APIs for region-specific news from Express Tribune with LLM summaries",
+    default_response_class=ORJSONResponse
+)
 
 # Pydantic models
 class Top3TitlesResponse(BaseModel):
@@ -69,6 +120,7 @@ class Top10DetailsResponse(BaseModel):
     details: List[NewsDetail] = Field(..., description="Top 10 news details for the region, sorted by recency")
     region: str = Field(..., description="The queried region")
     total_available: int = Field(..., description="Total news items available for the region")
+    complete: bool = Field(True, description="False while summaries are still being generated; details then holds only the ready ones")
 
 class Region(str, Enum):
     Pakistan = "Pakistan"
@@ -96,66 +148,109 @@ class Location(BaseModel):
 class NewsCategory(BaseModel):
     category: Category = Field(..., description="Valid news categories")
 
+@app.on_event("startup")
+async def startup():
+    # Warm region summaries in the background so startup isn't blocked on RSS/Groq
+    app.state.prewarm_task = asyncio.create_task(prewarm_region_details())
+    app.state.refresh_task = asyncio.create_task(refresh_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    # Stop background work before closing the clients it uses
+    tasks = [app.state.prewarm_task, app.state.refresh_task, *generation_tasks.values()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await aclose_client()
+    await groq_client.aclose()
+
 @app.get("/")
 async def home():
     return {"message": "Welcome to AI News Simulator"}
 
-async def fetch_top_items(region: str, query: str, days_back: int, max_items: int):
-    """Helper to fetch news items asynchronously."""
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, lambda: fetch_tribune_news(region=region, query=query, days_back=days_back, max_items=max_items))
+async def summarize_item(index: int, item: dict) -> Tuple[int, str, bool]:
+    """
+    Summarize one news item, falling back to its raw text if the LLM call fails.
+    Returns (index, summary, ok) where `ok` is False for the fallback text.
+    """
+    content = item['summary_text']
+    try:
+        summary = await summarize(content)
+        if not summary:
+            raise ValueError("empty summary")
+    except Exception as e:
+        print(f"Error summarizing '{item['title'][:50]}': {e}")
+        return index, content[:300], False
+    return index, summary, True
 
-async def generate_top_10_details(region: str, query: str, days_back: int, key: str):
-    """Generate top 10 news details with summaries for a region."""
-    if key in details_cache:
+async def generate_top_10_details(region: str, query: str, days_back: int, key: str, refresh: bool = False):
+    """Generate top 10 news details with summaries for a region. With `refresh`, rebuild even if cached."""
+    if key in details_cache and not refresh:
         return  # Already done
 
-    if key not in raw_cache:
-        # Raw not available, fetch it
-        raw_items = await fetch_top_items(region, query, days_back, 10)
-        raw_cache[key] = (raw_items, time())
-    else:
-        cached = raw_cache.get(key)
-        if not is_cache_valid(cached[1]):
-            # Expired, refetch
-            raw_items = await fetch_top_items(region, query, days_back, 10)
-            raw_cache[key] = (raw_items, time())
-        else:
-            raw_items = cached[0]
-
-    if not raw_items:
-        return
-
-    # Generate summaries in parallel
-    summary_tasks = []
-    for item in raw_items:
-        content = item['full_content'] or item['summary']
-        summary_tasks.append(summarizer.ainvoke({"content": content[:2000]}))
-
+    raw_items = None if refresh else raw_cache.get(key)
+    if raw_items is None:
+        # Raw not available or expired, fetch it
+        raw_items = await afetch_tribune_news(region=region, query=query, days_back=days_back, max_items=10)
+        if not raw_items:
+            # Empty usually means a failed fetch; keep whatever is cached rather than caching nothing
+            return
+        raw_cache[key] = raw_items
+
+    # On refresh, LLM failures reuse the earlier summary for the same article instead of raw-text fallback
+    previous = {detail.link: detail for detail in details_cache.get(key) or []} if refresh else {}
+
+    # Generate summaries in parallel, publishing each one as soon as it is ready
+    details = [None] * len(raw_items)
+    partial_details_cache[key] = details
+    summary_tasks = [summarize_item(i, item) for i, item in enumerate(raw_items)]
     try:
-        summaries = await asyncio.gather(*summary_tasks, return_exceptions=True)
-    except Exception as e:
-        print(f"Error in parallel summaries: {e}")
-        return
-
-    details = []
-    for i, item in enumerate(raw_items):
-        if isinstance(summaries[i], Exception):
-            summary = (item['full_content'] or item['summary'])[:300]
-        else:
-            summary = summaries[i]
-        brief_summary = str(summary)[:300] + "..." if len(str(summary)) > 300 else str(summary)
-        details.append(
-            NewsDetail(
+        for next_done in asyncio.as_completed(summary_tasks):
+            i, summary, ok = await next_done
+            item = raw_items[i]
+            if not ok and item['link'] in previous:
+                details[i] = previous[item['link']]
+                continue
+            brief_summary = summary[:300] + "..." if len(summary) > 300 else summary
+            details[i] = NewsDetail(
                 title=item['title'],
                 link=item['link'],
                 brief_summary=brief_summary,
                 img = item['img'],
                 published=item.get('published')
             )
-        )
 
-    details_cache[key] = (details, time())
+        details_cache[key] = details
+    finally:
+        # Never leave a half-filled entry behind, or it would block new generations until it expires
+        partial_details_cache.pop(key, None)
+
+def ensure_details_task(region: str, query: str, days_back: int, key: str, refresh: bool = False) -> asyncio.Task:
+    """Return the in-flight details generation for `key`, starting one if none is running."""
+    task = generation_tasks.get(key)
+    if task is None:
+        # Registered before the task's first await, so concurrent callers can't start a second generation
+        task = asyncio.create_task(generate_top_10_details(region, query, days_back, key, refresh=refresh))
+        generation_tasks[key] = task
+        task.add_done_callback(lambda done: generation_tasks.pop(key, None) if generation_tasks.get(key) is done else None)
+    return task
+
+async def prewarm_region_details(refresh: bool = False):
+    """Build details for every region's default view (no query, last 7 days) so first visitors hit a warm cache."""
+    # One region at a time so user-triggered summaries aren't queued behind all 70 prewarm calls.
+    # Iterate the Region members the routes receive, so the cache keys match.
+    for region in Region:
+        try:
+            # Joins a user-triggered generation for the same key instead of duplicating it
+            await ensure_details_task(region, "", 7, get_cache_key(region, "", 7), refresh=refresh)
+        except Exception as e:
+            print(f"Error prewarming details for {region.value}: {e}")
+
+async def refresh_loop():
+    """Rebuild prewarmed details every CACHE_TTL / 2 so they never expire under user traffic."""
+    while True:
+        await asyncio.sleep(CACHE_TTL / 2)
+        await prewarm_region_details(refresh=True)
 
 @app.get("/top_3_titles", response_model=Top3TitlesResponse)
 async def top_3_titles(
@@ -171,33 +266,23 @@ async def top_3_titles(
         key = get_cache_key(region, query, days_back)
         
         # Check raw cache first
-        fetch_raw = True
-        total_available = 10
-        if key in raw_cache:
-            cached_items, timestamp = raw_cache[key]
-            if is_cache_valid(timestamp):
-                news_items = cached_items[:3]
-                total_available = len(cached_items)
-                fetch_raw = False
-            else:
-                del raw_cache[key]
-                if key in details_cache:
-                    del details_cache[key]
-
-        if fetch_raw:
+        full_items = raw_cache.get(key)
+        if full_items is None:
             # Fetch raw top 10
-            full_items = await fetch_top_items(region, query, days_back, 10)
+            full_items = await afetch_tribune_news(region=region, query=query, days_back=days_back, max_items=10)
             if not full_items:
                 raise HTTPException(status_code=404, detail=f"No recent news found for region '{region}' with query '{query}'")
-            raw_cache[key] = (full_items, time())
-            news_items = full_items[:3]
-            total_available = len(full_items)
+            raw_cache[key] = full_items
+            # Summaries built from the previous raw fetch are stale now
+            details_cache.pop(key, None)
 
-        # Start background task for details if not already cached
+        # Start background task for details if not already cached or in progress,
+        # so summaries are being generated while the response is built
         if key not in details_cache:
-            asyncio.create_task(generate_top_10_details(region, query, days_back, key))
+            ensure_details_task(region, query, days_back, key)
 
-        titles = [item['title'] for item in news_items]
+        titles = [item['title'] for item in full_items[:3]]
+        total_available = len(full_items)
         
         return Top3TitlesResponse(
             titles=titles,
@@ -217,32 +302,35 @@ async def see_more_details(
 ):
     """
     Retrieve top 10 news details from cache (with LLM summaries). Falls back to generating if raw cached but details not ready.
+    While generation is in progress, returns the summaries ready so far with `complete=False`, or waits for the
+    full result if none are ready yet.
     """
     try:
         key = get_cache_key(region, query, days_back)
-        if key in details_cache:
-            details_list, timestamp = details_cache[key]
-            if is_cache_valid(timestamp):
-                return Top10DetailsResponse(
-                    details=details_list,
-                    region=region,
-                    total_available=len(details_list)
-                )
-
-        # Check raw cache
-        if key in raw_cache:
-            cached_items, timestamp = raw_cache[key]
-            if is_cache_valid(timestamp):
-                # Generate details on the fly
-                await generate_top_10_details(region, query, days_back, key)
-                # After generation, it should be in details_cache
-                if key in details_cache:
-                    details_list, _ = details_cache[key]
-                    return Top10DetailsResponse(
-                        details=details_list,
-                        region=region,
-                        total_available=len(details_list)
-                    )
+        details_list = details_cache.get(key)
+        complete = True
+        if details_list is None:
+            task = generation_tasks.get(key)
+            if task is None and key in raw_cache:
+                # Raw cached but details not ready, generate them on the fly
+                task = ensure_details_task(region, query, days_back, key)
+            if task is not None:
+                partial = partial_details_cache.get(key) or []
+                ready = [detail for detail in partial if detail is not None]
+                if ready and len(ready) < len(partial):
+                    details_list, complete = ready, False
+                else:
+                    # shield: a client disconnect must not cancel the shared generation
+                    await asyncio.shield(task)
+                    details_list = details_cache.get(key)
+
+        if details_list is not None:
+            return Top10DetailsResponse(
+                details=details_list,
+                region=region,
+                total_available=len(details_list),
+                complete=complete
+            )
 
         raise HTTPException(status_code=404, detail=f"No cached data found for region '{region}'. Call /top_3_titles first.")
     except ValueError as e:
@@ -250,7 +338,9 @@ async def see_more_details(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching details: {str(e)}")
 
-@app.get("/category_news", response_model=CategoryNewsResponse)
+# Items come from our own RSS parser, so the response is documented with CategoryNewsResponse
+# but returned as plain dicts without re-validating it on the way out
+@app.get("/category_news", response_model=None, responses={200: {"model": CategoryNewsResponse}})
 async def category_news(
     category: Category = Query(..., description="Category to fetch news for"),
     query: str = Query("", description="Optional keywords to filter (e.g., 'cricket')"),
@@ -263,8 +353,7 @@ async def category_news(
     """
     try:
         
-        news_items = await asyncio.to_thread(
-            fetch_news_by_category,
+        news_items = await afetch_news_by_category(
             category=category, query=query, days_back=days_back, max_items=max_items
         )
         if not news_items:
@@ -272,24 +361,26 @@ async def category_news(
 
         # Prepare response
         response_items = [
-            CategoryNewsItem(
-                title=item['title'],
-                link=item['link'],
-                img=item['img'],
-                full_content=item['full_content'] or item['summary'],
-                published=item.get('published')
-            ) for item in news_items
+            {
+                "title": item['title'],
+                "link": item['link'],
+                "img": item['img'],
+                "full_content": item['full_content'] or item['summary'],
+                "published": item.get('published')
+            } for item in news_items
         ]
 
-        return CategoryNewsResponse(
-            news_items=response_items,
-            category=category,
-            total_available=len(news_items)
-        )
+        return {
+            "news_items": response_items,
+            "category": category,
+            "total_available": len(news_items)
+        }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching category news: {str(e)}")
 
 if __name__ == "__main__":
+    # Single worker on purpose: the raw/details caches live in process memory.
+    # Install uvicorn[standard] so the default loop/http settings pick up uvloop and httptools.
     uvicorn.run(app, host="0.0.0.0", port=8002)
\ No newline at end of file
@@ -1,232 +1,194 @@
-import requests
-from xml.etree import ElementTree as ET
-from datetime import datetime, timedelta
-from dateutil.parser import parse as parse_date
+import asyncio
+import io
+import re
+import httpx
+from lxml import etree
+from selectolax.parser import HTMLParser
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 import pytz
-import hashlib
-import time
 from typing import List, Dict
 
-def fetch_tribune_news(region: str, query: str = "", days_back: int = 7, max_items: int = 10) -> List[Dict]:
+PK_TZ = pytz.timezone("Asia/Karachi")
+
+REGION_FEEDS = {
+    "Pakistan": "https://tribune.com.pk/feed/home",
+    "Punjab": "https://tribune.com.pk/feed/punjab",
+    "Sindh": "https://tribune.com.pk/feed/sindh",
+    "Balochistan": "https://tribune.com.pk/feed/balochistan",
+    "Khyber Pakhtunkhwa": "https://tribune.com.pk/feed/khyber-pakhtunkhwa",
+    "Jammu & Kashmir": "https://tribune.com.pk/feed/jammu-kashmir",
+    "Gilgit-Baltistan": "https://tribune.com.pk/feed/gilgit-baltistan"
+}
+
+CATEGORY_FEEDS = {
+    "Politics": "https://tribune.com.pk/feed/politics",
+    "Technology": "https://tribune.com.pk/feed/technology",
+    "Sports": "https://tribune.com.pk/feed/sports",
+    "Movies": "https://tribune.com.pk/feed/movies",
+    "Music": "https://tribune.com.pk/feed/music",
+    "Health": "https://tribune.com.pk/feed/health",
+    "Business": "https://tribune.com.pk/feed/business",
+    "World": "https://tribune.com.pk/feed/world"
+}
+
+# Shared client so concurrent feed pulls reuse TCP/TLS connections
+_client = httpx.AsyncClient(
+    timeout=10,
+    http2=True,
+    follow_redirects=True,  # requests.get followed redirects; keep that for moved feed URLs
+    limits=httpx.Limits(max_keepalive_connections=32)
+)
+# All feeds live on tribune.com.pk, so cap in-flight requests to be polite to the host
+_host_semaphore = asyncio.Semaphore(4)
+
+async def aclose_client():
+    """Close the shared HTTP client (call on application shutdown)."""
+    await _client.aclose()
+
+async def _fetch_feed(rss_url: str, source_label: str, source_kind: str, query: str, days_back: int, max_items: int) -> List[Dict]:
     """
-    Fetch Express Tribune news for a specific region from RSS feed, optionally filtered by query.
-    Returns unique items with full content and metadata, up to `max_items`, within `days_back` days.
+    Fetch and parse one Express Tribune RSS feed, optionally filtered by query.
+    `source_kind` is "region" or "category": region items carry a `region` field, while category
+    items fall back to `source_label` when the entry has no <category> of its own.
     """
-    rss_feeds = {
-        "Pakistan": "https://tribune.com.pk/feed/home",
-        "Punjab": "https://tribune.com.pk/feed/punjab",
-        "Sindh": "https://tribune.com.pk/feed/sindh",
-        "Balochistan": "https://tribune.com.pk/feed/balochistan",
-        "Khyber Pakhtunkhwa": "https://tribune.com.pk/feed/khyber-pakhtunkhwa",
-        "Jammu & Kashmir": "https://tribune.com.pk/feed/jammu-kashmir",
-        "Gilgit-Baltistan": "https://tribune.com.pk/feed/gilgit-baltistan"
-    }
-    
-    if region not in rss_feeds:
-        raise ValueError(f"Unknown region: {region}. Available: {list(rss_feeds.keys())}")
-    
-    rss_url = rss_feeds[region]
     all_headlines = []
-    seen_hashes = set()
-    pk_timezone = pytz.timezone("Asia/Karachi")
-    cutoff_date = datetime.now(pk_timezone) - timedelta(days=days_back)
-    query_lower = query.lower().strip() if query else ""
-    
+    seen_keys = set()
+    default_category = source_label if source_kind == "category" else ""
+    # One timestamp per feed: every item in it is fetched at essentially the same instant
+    now = datetime.now(PK_TZ)
+    fetched_at = now.isoformat()
+    cutoff_date = now - timedelta(days=days_back)
+    # Case-insensitive search avoids lowercasing full_content for every item
+    query_pattern = re.compile(re.escape(query.strip()), re.IGNORECASE) if query and query.strip() else None
+
     try:
-        response = requests.get(rss_url, timeout=10)
+        async with _host_semaphore:
+            response = await _client.get(rss_url)
         response.raise_for_status()
-        root = ET.fromstring(response.content)
-        
+
         namespace = {'content': 'http://purl.org/rss/1.0/modules/content/'}
-        items = root.findall('.//item')
-        print(f"Raw RSS entries for {region}: {len(items)}")  # Debug
-        
-        for item in items[:max_items * 2]:  # Fetch extra for filtering
-            title_elem = item.find('title')
-            title = title_elem.text.strip() if title_elem is not None else ""
-            
-            link_elem = item.find('link')
-            link = link_elem.text.strip() if link_elem is not None else ""
-            
-            img_elem = item.find('.//image/img')
-            img = img_elem.get("src") if img_elem is not None else ""
-            pub_date_elem = item.find('pubDate')
-            pub_date_str = pub_date_elem.text.strip() if pub_date_elem is not None else datetime.now(pk_timezone).isoformat()
-            try:
-                pub_date = parse_date(pub_date_str)
-            except (ValueError, TypeError):
-                print(f"Invalid date for '{title[:50]}' in {region}: {pub_date_str}")
-                pub_date = datetime.now(pk_timezone)
-            
-            if pub_date < cutoff_date:
-                continue
-            
-            desc_elem = item.find('description')
-            summary = ""
-            if desc_elem is not None:
-                summary = desc_elem.text.strip() if desc_elem.text else ""
-            
-            content_elem = item.find('content:encoded', namespace)
-            full_content = content_elem.text.strip() if content_elem is not None and content_elem.text else ""
-            
-            cat_elem = item.find('category')
-            category = cat_elem.text.strip() if cat_elem is not None else ""
-            
-            # Simple keyword filter for query
-            if query_lower and not (
-                query_lower in title.lower() or
-                query_lower in summary.lower() or
-                query_lower in full_content.lower()
-            ):
-                continue
-            
-            news_item = {
-                "title": title,
-                "link": link,
-                "img": img,
-                "published": pub_date.isoformat(),
-                "summary": summary,
-                "full_content": full_content,
-                "category": category,
-                "region": region,
-                "source_url": rss_url,
-                "fetched_at": datetime.now(pk_timezone).isoformat()
-            }
-            
-            content_hash = hashlib.md5(f"{news_item['title']}{news_item['published']}".encode()).hexdigest()
-            if content_hash in seen_hashes:
-                print(f"Skipping duplicate in {region}: {title[:50]}...")
-                continue
-            seen_hashes.add(content_hash)
-            all_headlines.append(news_item)
-            
-            if len(all_headlines) >= max_items:
+        scanned = 0
+
+        # Stream <item> elements so we never build the full tree and can stop early
+        # Feed XML comes from the network, so never expand external entities (XXE)
+        for _, item in etree.iterparse(io.BytesIO(response.content), tag='item', resolve_entities=False):
+            scanned += 1
+            if scanned > max_items * 2:  # Fetch extra for filtering
                 break
+            try:
+                title_elem = item.find('title')
+                title = title_elem.text.strip() if title_elem is not None else ""
+
+                link_elem = item.find('link')
+                link = link_elem.text.strip() if link_elem is not None else ""
+
+                img_elem = item.find('.//image/img')
+                img = img_elem.get("src") if img_elem is not None else ""
+
+                pub_date_elem = item.find('pubDate')
+                pub_date_str = pub_date_elem.text.strip() if pub_date_elem is not None else ""
+                try:
+                    # pubDate is RFC 822, so parse it directly instead of guessing the format
+                    pub_date = parsedate_to_datetime(pub_date_str) if pub_date_str else now
+                    if pub_date.tzinfo is None:  # "-0000" offset means UTC
+                        pub_date = pub_date.replace(tzinfo=timezone.utc)
+                except (ValueError, TypeError):
+                    print(f"Invalid date for '{title[:50]}' in {source_label}: {pub_date_str}")
+                    pub_date = now
+
+                if pub_date < cutoff_date:
+                    continue
+
+                desc_elem = item.find('description')
+                summary = ""
+                if desc_elem is not None:
+                    summary = desc_elem.text.strip() if desc_elem.text else ""
+
+                content_elem = item.find('content:encoded', namespace)
+                raw_content = content_elem.text if content_elem is not None and content_elem.text else ""
+                # content:encoded is HTML; keep only the article text so LLM prompts aren't spent on markup
+                full_content = ""
+                if raw_content:
+                    tree = HTMLParser(raw_content)
+                    # Embedded tweet/ad scripts and CSS are text nodes too, so drop them first
+                    tree.strip_tags(["script", "style", "noscript"])
+                    full_content = tree.text(separator=" ", strip=True)
+
+                cat_elem = item.find('category')
+                item_category = cat_elem.text.strip() if cat_elem is not None else default_category
+
+                # Simple keyword filter for query
+                if query_pattern and not (
+                    query_pattern.search(title) or
+                    query_pattern.search(summary) or
+                    query_pattern.search(full_content)
+                ):
+                    continue
 
-        time.sleep(1)  # Polite delay
+                news_item = {
+                    "title": title,
+                    "link": link,
+                    "img": img,
+                    "published": pub_date.isoformat(),
+                    "summary": summary,
+                    "full_content": full_content,
+                    # Pre-truncated LLM input, so summarization never slices the full body
+                    "summary_text": (full_content or summary)[:2000],
+                    "category": item_category,
+                    "source_url": rss_url,
+                    "fetched_at": fetched_at
+                }
+                if source_kind == "region":
+                    news_item["region"] = source_label
 
-    except requests.RequestException as e:
-        print(f"Network error fetching {region} RSS: {e}")
+                dedup_key = (news_item['title'], news_item['published'])
+                if dedup_key in seen_keys:
+                    print(f"Skipping duplicate in {source_label}: {title[:50]}...")
+                    continue
+                seen_keys.add(dedup_key)
+                all_headlines.append(news_item)
+
+                if len(all_headlines) >= max_items:
+                    break
+            finally:
+                # Free parsed elements as we go to keep memory flat
+                item.clear()
+                while item.getprevious() is not None:
+                    del item.getparent()[0]
+
+    except httpx.HTTPError as e:
+        print(f"Network error fetching {source_label} RSS: {e}")
         return []
-    except ET.ParseError as e:
-        print(f"XML parse error for {region} RSS: {e}")
+    except etree.XMLSyntaxError as e:
+        print(f"XML parse error for {source_label} RSS: {e}")
         return []
     except Exception as e:
-        print(f"Unexpected error fetching {region} RSS: {e}")
+        print(f"Unexpected error fetching {source_label} RSS: {e}")
         return []
 
     return sorted(all_headlines, key=lambda x: x["published"], reverse=True)
 
 
-def fetch_news_by_category(category: str, query: str = "", days_back: int = 7, max_items: int = 10) -> List[Dict]:
+async def afetch_tribune_news(region: str, query: str = "", days_back: int = 7, max_items: int = 10) -> List[Dict]:
     """
-    Fetch Express Tribune news for a specific category from RSS feed, optionally filtered by query.
+    Fetch Express Tribune news for a specific region from RSS feed, optionally filtered by query.
     Returns unique items with full content and metadata, up to `max_items`, within `days_back` days.
     """
-    rss_feeds = {
-        "Politics": "https://tribune.com.pk/feed/politics",
-        "Technology": "https://tribune.com.pk/feed/technology",
-        "Sports": "https://tribune.com.pk/feed/sports",
-        "Movies": "https://tribune.com.pk/feed/movies",
-        "Music": "https://tribune.com.pk/feed/music",
-        "Health": "https://tribune.com.pk/feed/health",
-        "Business": "https://tribune.com.pk/feed/business",
-        "World": "https://tribune.com.pk/feed/world"
-    }
-    
-    if category not in rss_feeds:
-        raise ValueError(f"Unknown category: {category}. Available: {list(rss_feeds.keys())}")
-    
-    rss_url = rss_feeds[category]
-    all_headlines = []
-    seen_hashes = set()
-    pk_timezone = pytz.timezone("Asia/Karachi")
-    cutoff_date = datetime.now(pk_timezone) - timedelta(days=days_back)
-    query_lower = query.lower().strip() if query else ""
-    
-    try:
-        response = requests.get(rss_url, timeout=10)
-        response.raise_for_status()
-        root = ET.fromstring(response.content)
-        
-        namespace = {'content': 'http://purl.org/rss/1.0/modules/content/'}
-        items = root.findall('.//item')
-        print(f"Raw RSS entries for {category}: {len(items)}")  # Debug
-        
-        for item in items[:max_items * 2]:  # Fetch extra for filtering
-            title_elem = item.find('title')
-            title = title_elem.text.strip() if title_elem is not None else ""
-            
-            link_elem = item.find('link')
-            link = link_elem.text.strip() if link_elem is not None else ""
-            
-            img_elem = item.find('.//image/img')
-            img = img_elem.get("src") if img_elem is not None else ""
-            
-            pub_date_elem = item.find('pubDate')
-            pub_date_str = pub_date_elem.text.strip() if pub_date_elem is not None else datetime.now(pk_timezone).isoformat()
-            try:
-                pub_date = parse_date(pub_date_str)
-            except (ValueError, TypeError):
-                print(f"Invalid date for '{title[:50]}' in {category}: {pub_date_str}")
-                pub_date = datetime.now(pk_timezone)
-            
-            if pub_date < cutoff_date:
-                continue
-            
-            desc_elem = item.find('description')
-            summary = ""
-            if desc_elem is not None:
-                summary = desc_elem.text.strip() if desc_elem.text else ""
-            
-            content_elem = item.find('content:encoded', namespace)
-            full_content = content_elem.text.strip() if content_elem is not None and content_elem.text else ""
-            
-            cat_elem = item.find('category')
-            item_category = cat_elem.text.strip() if cat_elem is not None else category
-            
-            # Simple keyword filter for query
-            if query_lower and not (
-                query_lower in title.lower() or
-                query_lower in summary.lower() or
-                query_lower in full_content.lower()
-            ):
-                continue
-            
-            news_item = {
-                "title": title,
-                "link": link,
-                "img": img,
-                "published": pub_date.isoformat(),
-                "summary": summary,
-                "full_content": full_content,
-                "category": item_category,
-                "source_url": rss_url,
-                "fetched_at": datetime.now(pk_timezone).isoformat()
-            }
-            
-            content_hash = hashlib.md5(f"{news_item['title']}{news_item['published']}".encode()).hexdigest()
-            if content_hash in seen_hashes:
-                print(f"Skipping duplicate in {category}: {title[:50]}...")
-                continue
-            seen_hashes.add(content_hash)
-            all_headlines.append(news_item)
-            
-            if len(all_headlines) >= max_items:
-                break
+    if region not in REGION_FEEDS:
+        raise ValueError(f"Unknown region: {region}. Available: {list(REGION_FEEDS.keys())}")
 
-        time.sleep(1)  # Polite delay
+    return await _fetch_feed(REGION_FEEDS[region], region, "region", query, days_back, max_items)
 
-    except requests.RequestException as e:
-        print(f"Network error fetching {category} RSS: {e}")
-        return []
-    except ET.ParseError as e:
-        print(f"XML parse error for {category} RSS: {e}")
-        return []
-    except Exception as e:
-        print(f"Unexpected error fetching {category} RSS: {e}")
-        return []
 
-    return sorted(all_headlines, key=lambda x: x["published"], reverse=True)
+async def afetch_news_by_category(category: str, query: str = "", days_back: int = 7, max_items: int = 10) -> List[Dict]:
+    """
+    Fetch Express Tribune news for a specific category from RSS feed, optionally filtered by query.
+    Returns unique items with full content and metadata, up to `max_items`, within `days_back` days.
+    """
+    if category not in CATEGORY_FEEDS:
+        raise ValueError(f"Unknown category: {category}. Available: {list(CATEGORY_FEEDS.keys())}")
+
+    return await _fetch_feed(CATEGORY_FEEDS[category], category, "category", query, days_back, max_items)
 
-# fetch_news_by_category(category="Sports")
\ No newline at end of file
+# asyncio.run(afetch_news_by_category(category="Sports"))
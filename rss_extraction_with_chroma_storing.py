@@ -3,15 +3,44 @@ import feedparser
 import hashlib
 import time
 from typing import List, Dict
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from sentence_transformers import SentenceTransformer
-from dateutil.parser import parse as parse_date
 import pytz
 
-# Chroma setup (persistent)
+# Use Pakistan timezone (+05:00) for offset-aware datetime
+PK_TZ = pytz.timezone("Asia/Karachi")
+
+# Chroma setup (persistent), opened on first use rather than at import
 dbpath = r"Chromadb"
-client = chromadb.PersistentClient(path=dbpath)
-model = SentenceTransformer('all-MiniLM-L6-v2')  # Lightweight, local embeddings
+EMBED_MODEL_NAME = 'all-MiniLM-L6-v2'  # Lightweight, local embeddings
+_client = None
+_model = None
+
+def get_client():
+    """Open the persistent Chroma client on first use."""
+    global _client
+    if _client is None:
+        _client = chromadb.PersistentClient(path=dbpath)
+    return _client
+
+def get_model() -> SentenceTransformer:
+    """Load the embedding model on first use."""
+    global _model
+    if _model is None:
+        _model = SentenceTransformer(EMBED_MODEL_NAME)
+    return _model
+
+def embed_batch(texts: List[str]) -> List[List[float]]:
+    """Embed a batch of texts in one model call."""
+    embeddings = get_model().encode(
+        texts,
+        batch_size=64,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False
+    )
+    return embeddings.tolist()
 
 def fetch_tribune_news(days_back: int = 7, max_items: int = 100) -> List[Dict]:
     """
@@ -20,10 +49,11 @@ def fetch_tribune_news(days_back: int = 7, max_items: int = 100) -> List[Dict]:
     """
     rss_url = "https://tribune.com.pk/feed/home"
     all_headlines = []
-    seen_hashes = set()
-    # Use Pakistan timezone (+05:00) for offset-aware datetime
-    pk_timezone = pytz.timezone("Asia/Karachi")
-    cutoff_date = datetime.now(pk_timezone) - timedelta(days=days_back)
+    seen_keys = set()
+    # One timestamp per feed: every item in it is fetched at essentially the same instant
+    now = datetime.now(PK_TZ)
+    fetched_at = now.isoformat()
+    cutoff_date = now - timedelta(days=days_back)
 
     try:
         feed = feedparser.parse(rss_url)
@@ -33,12 +63,15 @@ def fetch_tribune_news(days_back: int = 7, max_items: int = 100) -> List[Dict]:
 
         for entry in feed.entries:
             # Parse pubDate
-            pub_date_str = entry.get("published", datetime.now(pk_timezone).isoformat())
+            pub_date_str = entry.get("published", "")
             try:
-                pub_date = parse_date(pub_date_str)
+                # pubDate is RFC 822, so parse it directly instead of guessing the format
+                pub_date = parsedate_to_datetime(pub_date_str) if pub_date_str else now
+                if pub_date.tzinfo is None:  # "-0000" offset means UTC
+                    pub_date = pub_date.replace(tzinfo=timezone.utc)
             except (ValueError, TypeError):
                 print(f"Invalid date format for {entry.get('title', 'unknown')}: {pub_date_str}")
-                pub_date = datetime.now(pk_timezone)
+                pub_date = now
 
             # Filter by date
             if pub_date < cutoff_date:
@@ -52,14 +85,14 @@ def fetch_tribune_news(days_back: int = 7, max_items: int = 100) -> List[Dict]:
                 "full_content": entry.get("content", [{}])[0].get("value", "").strip(),
                 "category": entry.get("category", ""),
                 "source_url": rss_url,
-                "fetched_at": datetime.now(pk_timezone).isoformat()
+                "fetched_at": fetched_at
             }
 
-            # Dedup hash
-            content_hash = hashlib.md5(f"{news_item['title']}{news_item['published']}".encode()).hexdigest()
-            if content_hash in seen_hashes:
+            # Dedup key
+            dedup_key = (news_item['title'], news_item['published'])
+            if dedup_key in seen_keys:
                 continue
-            seen_hashes.add(content_hash)
+            seen_keys.add(dedup_key)
             all_headlines.append(news_item)
 
             if len(all_headlines) >= max_items:
@@ -73,12 +106,20 @@ def fetch_tribune_news(days_back: int = 7, max_items: int = 100) -> List[Dict]:
 
     return sorted(all_headlines, key=lambda x: x["published"], reverse=True)
 
+def content_id(item: Dict) -> str:
+    """
+    Stable Chroma document ID for a news item.
+    Kept as MD5 of title + published so IDs match documents already stored by earlier runs.
+    """
+    return hashlib.md5(f"{item['title']}{item['published']}".encode()).hexdigest()
+
 def store_in_chroma(items: List[Dict], collection_name: str = "tribune_news"):
     """
     Embed and store only new Tribune news items in Chroma.
     Embeds title + summary + full_content; ID = content_hash.
     Skips items already in the collection.
     """
+    client = get_client()
     try:
         collection = client.get_or_create_collection(
             name=collection_name,
@@ -90,34 +131,33 @@ def store_in_chroma(items: List[Dict], collection_name: str = "tribune_news"):
             metadata={"hnsw:space": "cosine"}
         )
 
-    # Get all existing IDs in the collection
-    existing_ids = set(collection.get(include=[])['ids'])
+    # Hash candidates first so Chroma is only asked about these IDs, not the whole collection
+    candidate_ids = [content_id(item) for item in items]
+    unique_ids = list(dict.fromkeys(candidate_ids))
+    existing_ids = set(collection.get(ids=unique_ids, include=[])['ids']) if unique_ids else set()
 
-    inserted = 0
     ids = []
     documents = []
-    embeddings = []
     metadatas = []
 
-    for item in items:
-        content_hash = hashlib.md5(f"{item['title']}{item['published']}".encode()).hexdigest()
-        
-        # Skip if already in collection
+    for item, content_hash in zip(items, candidate_ids):
+        # Skip if already in collection (or earlier in this batch)
         if content_hash in existing_ids:
             print(f"Skipping duplicate: {item['title'][:50]}...")
             continue
+        existing_ids.add(content_hash)
 
         # Embed: Use full content for richer context
         text_to_embed = f"{item['title']} {item['summary']} {item['full_content']}"[:5000]
-        embedding = model.encode(text_to_embed).tolist()
 
         ids.append(content_hash)
         documents.append(text_to_embed)
         metadatas.append({**item, "content_hash": content_hash})
-        embeddings.append(embedding)
-        inserted += 1
 
+    inserted = len(ids)
     if ids:
+        # Embed all new documents in one batched call
+        embeddings = embed_batch(documents)
         collection.add(
             ids=ids,
             documents=documents,